@@ -2,17 +2,23 @@ import os
 import cv2
 import numpy as np
 from read import DiagramAnalyzer
-import tempfile
 from math_solver import try_sympy_solve
 from gemini_helper import get_gemini_explanation
 from formulas import calculate_shape_property, get_supported_shapes
-from PIL import Image
 import pytesseract
 import io
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, url_for
 from flask_cors import CORS
-from ocr_trocr import extract_clean_math_from_image
+from flask_compress import Compress
+from ocr_trocr import extract_clean_math_from_images
 import re
+import threading
+import hashlib
+import base64
+import json
+import time
+import uuid
+from collections import OrderedDict
 
 
 # --- OCR Preprocessing Helpers ---
@@ -20,11 +26,25 @@ import re
 # Replace any call to pytesseract.image_to_string or similar with extract_math_from_image
 # If there is a function or endpoint that handles OCR, update it to use extract_math_from_image
 
+# EasyOCR loads its detector and recognizer weights on construction, so a
+# single reader is created lazily and shared across requests
+_easyocr_reader = None
+_easyocr_lock = threading.Lock()
+
+def get_easyocr_reader():
+    """Return the shared EasyOCR reader, creating it on first use"""
+    global _easyocr_reader
+    if _easyocr_reader is None:
+        with _easyocr_lock:
+            if _easyocr_reader is None:
+                import easyocr
+                _easyocr_reader = easyocr.Reader(['en'])
+    return _easyocr_reader
+
 def try_easyocr_fallback(image):
     """Fallback to EasyOCR if available (requires: pip install easyocr)"""
     try:
-        import easyocr
-        reader = easyocr.Reader(['en'])
+        reader = get_easyocr_reader()
         results = reader.readtext(np.array(image))
         
         # Extract text from results
@@ -46,57 +66,136 @@ def try_easyocr_fallback(image):
     
     return None
 
+# Common OCR mistakes for math characters
+_OCR_REPLACEMENTS = {
+    'l': '1',      # lowercase L often misread as 1
+    'I': '1',      # uppercase I often misread as 1
+    'O': '0',      # uppercase O often misread as 0
+    'o': '0',      # lowercase o often misread as 0
+    'S': '5',      # S sometimes misread as 5
+    's': '5',      # s sometimes misread as 5
+    'G': '6',      # G sometimes misread as 6
+    'g': '9',      # g sometimes misread as 9
+    'B': '8',      # B sometimes misread as 8
+    'Z': '2',      # Z sometimes misread as 2
+    'z': '2',      # z sometimes misread as 2
+    '×': '*',      # multiplication symbol
+    '÷': '/',      # division symbol
+    '−': '-',      # minus sign
+    '[': '(',      # brackets normalised to parentheses
+    ']': ')',
+    '{': '(',
+    '}': ')',
+}
+# Applied in a single translate pass
+_OCR_TRANS = str.maketrans(_OCR_REPLACEMENTS)
+
+# Characters kept after post-processing; everything else is dropped
+_OCR_ALLOWED_CHARS = frozenset('0123456789+-*/=().xX ')
+_OCR_DISALLOWED_RE = re.compile('[^' + re.escape(''.join(sorted(_OCR_ALLOWED_CHARS))) + ']')
+
+# Presence of any of these marks OCR output as a math expression
+_MATH_OP_RE = re.compile(r'[+\-*/^=]')
+
+# Deleting the math symbols lets str.translate count them in one C pass
+_STRIP_MATH_SYMBOLS = str.maketrans('', '', '+-*/=()')
+
+def is_confident_math(text):
+    """True when OCR text already has at least 3 digits and an operator"""
+    return sum(c.isdigit() for c in text) >= 3 and _MATH_OP_RE.search(text) is not None
+
+def score_ocr_candidate(text):
+    """Rank OCR candidates by length plus number of math symbols"""
+    return 2 * len(text) - len(text.translate(_STRIP_MATH_SYMBOLS))
+
 def post_process_ocr_text(text):
     """Post-process OCR text to fix common math character misrecognitions"""
     if not text:
         return text
     
-    # Common OCR mistakes for math characters
-    replacements = {
-        'l': '1',      # lowercase L often misread as 1
-        'I': '1',      # uppercase I often misread as 1
-        'O': '0',      # uppercase O often misread as 0
-        'o': '0',      # lowercase o often misread as 0
-        'S': '5',      # S sometimes misread as 5
-        's': '5',      # s sometimes misread as 5
-        'G': '6',      # G sometimes misread as 6
-        'g': '9',      # g sometimes misread as 9
-        'B': '8',      # B sometimes misread as 8
-        'Z': '2',      # Z sometimes misread as 2
-        'z': '2',      # z sometimes misread as 2
-        '×': '*',      # multiplication symbol
-        '÷': '/',      # division symbol
-        '−': '-',      # minus sign
-        '=': '=',      # equals sign
-        '(': '(',      # parentheses
-        ')': ')',
-        '[': '(',
-        ']': ')',
-        '{': '(',
-        '}': ')',
-    }
-    
-    # Apply replacements
-    processed = text
-    for old, new in replacements.items():
-        processed = processed.replace(old, new)
-    
-    # Remove extra spaces and normalize
-    processed = ' '.join(processed.split())
+    # Apply replacements and normalise whitespace
+    processed = ' '.join(text.translate(_OCR_TRANS).split())
     
     # Remove non-math characters (keep only allowed characters)
-    allowed_chars = '0123456789+-*/=().xX '
-    processed = ''.join(c for c in processed if c in allowed_chars)
+    processed = _OCR_DISALLOWED_RE.sub('', processed)
     
     return processed.strip()
 # --- End OCR Preprocessing Helpers ---
 
 
+# --- OCR Result Cache ---
+# Canvas re-submits and page reloads post identical images, so the final /ocr
+# payload is cached under the SHA256 of the uploaded bytes (bounded LRU)
+_OCR_CACHE_SIZE = 512
+_ocr_cache = OrderedDict()
+_ocr_cache_lock = threading.Lock()
+
+def _ocr_cache_get(key):
+    with _ocr_cache_lock:
+        payload = _ocr_cache.get(key)
+        if payload is not None:
+            _ocr_cache.move_to_end(key)
+        return payload
+
+def _ocr_cache_put(key, payload):
+    with _ocr_cache_lock:
+        _ocr_cache[key] = payload
+        _ocr_cache.move_to_end(key)
+        if len(_ocr_cache) > _OCR_CACHE_SIZE:
+            _ocr_cache.popitem(last=False)
+
+# --- End OCR Result Cache ---
+
+
 # Remove pytesseract.pytesseract.tesseract_cmd line
 
 
 app = Flask(__name__)
 CORS(app)
+Compress(app)
+
+# The supported-shapes table is a constant, so it is serialised once
+_SHAPES_JSON = json.dumps({'shapes': get_supported_shapes(), 'success': True})
+
+
+# --- Visualization Files ---
+# /analyze writes its visualization under static/vis and returns the URL;
+# a daemon thread deletes files once the client has had time to fetch them.
+# Both are set up on the first /analyze, so importing the app has no side effects.
+VIS_DIR = os.path.join(app.static_folder, 'vis')
+VIS_MAX_AGE_SECONDS = 10 * 60
+_vis_cleaner_started = False
+_vis_cleaner_lock = threading.Lock()
+
+def _clean_old_visualizations():
+    while True:
+        cutoff = time.time() - VIS_MAX_AGE_SECONDS
+        try:
+            for entry in os.scandir(VIS_DIR):
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError as e:
+            print(f"Visualization cleanup error: {e}")
+        time.sleep(60)
+
+def ensure_vis_dir():
+    """Create the visualization directory and start its cleaner once per process"""
+    global _vis_cleaner_started
+    if not _vis_cleaner_started:
+        with _vis_cleaner_lock:
+            if not _vis_cleaner_started:
+                os.makedirs(VIS_DIR, exist_ok=True)
+                threading.Thread(target=_clean_old_visualizations, daemon=True).start()
+                _vis_cleaner_started = True
+    return VIS_DIR
+# --- End Visualization Files ---
+
+def read_upload_buffer(file):
+    """Read an uploaded file into a read-only uint8 array without copying the bytes"""
+    # Reading the underlying stream skips FileStorage.read()'s extra wrapping
+    buf = np.frombuffer(file.stream.read(), np.uint8)
+    buf.flags.writeable = False
+    return buf
 
 @app.route('/')
 def index():
@@ -107,29 +206,104 @@ def analyze():
     if 'image' not in request.files:
         return jsonify({'error': 'No image uploaded'}), 400
     file = request.files['image']
-    img_array = np.frombuffer(file.read(), np.uint8)
+    img_array = read_upload_buffer(file)
     img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
     if img is None:
         return jsonify({'error': 'Invalid image'}), 400
     analyzer = DiagramAnalyzer(image_array=img)
     analyzer.load_image()
-    thresh = analyzer.preprocess_image()
+    analyzer.preprocess_image()
     edges = analyzer.detect_edges()
     contours = analyzer.find_contours(edges)
     analyzer.analyze_all_shapes(contours)
-    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmpfile:
-        vis_path = tmpfile.name
-    analyzer.create_visualization(contours, vis_path)
-    with open(vis_path, 'rb') as f:
-        vis_bytes = f.read()
-    
-    import base64
-    vis_b64 = base64.b64encode(vis_bytes).decode('utf-8')
-    os.remove(vis_path)
-    return jsonify({
+    vis_image = analyzer.create_visualization_array(contours, analyzer.contour_shapes)
+    if vis_image is None:
+        return jsonify({'error': 'Could not create visualization'}), 500
+    # Encode in memory; compression level 3 is about half the CPU of the default
+    ok, png = cv2.imencode('.png', vis_image, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+    if not ok:
+        return jsonify({'error': 'Could not encode visualization'}), 500
+    vis_bytes = png.tobytes()
+    vis_name = f"{uuid.uuid4().hex}.png"
+    with open(os.path.join(ensure_vis_dir(), vis_name), 'wb') as f:
+        f.write(vis_bytes)
+    response = {
         'results': analyzer.results,
-        'visualization': vis_b64
-    })
+        'visualization_url': url_for('static', filename=f'vis/{vis_name}')
+    }
+    # Older clients can still ask for the PNG inline as base64
+    if request.form.get('inline'):
+        response['visualization'] = base64.b64encode(vis_bytes).decode('utf-8')
+    return jsonify(response)
+
+# Larger uploads (e.g. 4K canvas exports) are shrunk before any OCR work
+OCR_MAX_SIDE = 1024
+
+def limit_image_size(img, max_side=OCR_MAX_SIDE):
+    """Downscale an image so its longest side is at most max_side pixels"""
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def preprocess_math_image(gray):
+    """Binarise a grayscale image for OCR: 5x5 Gaussian blur, then adaptive Gaussian threshold"""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    return cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY_INV, 11, 2)
+
+def run_ocr_pipeline(gray):
+    """Run OCR on a decoded grayscale image and build the /ocr response payload"""
+    gray = limit_image_size(gray)
+    
+    # Try multiple preprocessing approaches
+    results = []
+    seen = set()
+    
+    def collect(outputs):
+        for raw_ocr, clean_math in outputs:
+            for text in (raw_ocr, clean_math):
+                if text and text not in seen:
+                    seen.add(text)
+                    results.append(text)
+    
+    # Approach 1: Original image as drawn
+    collect(extract_clean_math_from_images([gray]))
+    
+    # Only pay for the fallback when the first read looks weak
+    if not any(is_confident_math(text) for text in results):
+        # Approach 2: Blur + adaptive thresholding, robust to uneven strokes and lighting
+        collect(extract_clean_math_from_images([preprocess_math_image(gray)]))
+    
+    # Choose the best result (most characters, or most math-like)
+    if results:
+        # Prefer results with more math symbols
+        best_result = max(results, key=score_ocr_candidate)
+        # Post-process the result
+        processed_result = post_process_ocr_text(best_result)
+        print(f"OCR OUTPUT (best of {len(results)} attempts): {best_result}")
+        print(f"Post-processed result: {processed_result}")
+        
+        if not _MATH_OP_RE.search(processed_result):
+            return {'error': 'No math operator detected in OCR output.', 'ocr_output': best_result, 'postprocessed': processed_result}
+        else:
+            clean_math = processed_result.strip()
+            print("🧮 Sending to SymPy:", clean_math)
+            result, steps, error = try_sympy_solve(clean_math)
+            # Convert result to string for JSON serialization
+            result_str = str(result) if result is not None else None
+            return {'ocr_output': best_result, 'postprocessed': processed_result, 'result': result_str, 'steps': steps, 'error': error}
+    else:
+        # Try EasyOCR as fallback
+        print("Tesseract failed, trying EasyOCR fallback...")
+        easyocr_result = try_easyocr_fallback(gray)
+        if easyocr_result:
+            processed_easyocr = post_process_ocr_text(easyocr_result)
+            return {'text': processed_easyocr}
+        else:
+            print("All OCR methods failed to extract any text")
+            return {'text': ''}
 
 @app.route('/ocr', methods=['POST'])
 def ocr():
@@ -137,71 +311,23 @@ def ocr():
         return jsonify({'error': 'No image uploaded'}), 400
     file = request.files['image']
     try:
-        pil_img = Image.open(file.stream)
-        
-        # Try multiple preprocessing approaches
-        results = []
+        img_array = read_upload_buffer(file)
+        cache_key = hashlib.sha256(img_array).hexdigest()
+        payload = _ocr_cache_get(cache_key)
+        if payload is not None:
+            print(f"OCR cache hit: {cache_key[:12]}")
+            return jsonify(payload)
         
-        # Approach 1: Enhanced preprocessing
-        # preprocessed = preprocess_image_for_ocr(pil_img) # Removed
-        # upscaled = upscale_image(preprocessed, scale=3) # Removed
-        whitelist = '0123456789+-*/=().xX'
-        raw_ocr, clean_math = extract_clean_math_from_image(pil_img) # Replaced
-        if raw_ocr:
-            results.append(raw_ocr)
+        # Decode straight to a single-channel array
+        gray = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return jsonify({'error': 'Invalid image'}), 400
         
-        # Approach 2: Math character enhancement
-        # enhanced = enhance_math_characters(pil_img) # Removed
-        # upscaled_enhanced = upscale_image(enhanced, scale=3) # Removed
-        if clean_math:
-            results.append(clean_math)
-        
-        # Approach 3: Original image with different preprocessing
-        if len(results) < 2:
-            # Simple thresholding approach
-            img_array = np.array(pil_img)
-            if len(img_array.shape) == 3:
-                gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY)
-            else:
-                gray = img_array
-            
-            # Apply different thresholding
-            _, simple_thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV)
-            simple_img = Image.fromarray(simple_thresh)
-            # upscaled_simple = upscale_image(simple_img, scale=3) # Removed
-            text3 = extract_clean_math_from_image(simple_img) # Replaced
-            if text3 and text3 not in results:
-                results.append(text3)
-        
-        # Choose the best result (most characters, or most math-like)
-        if results:
-            # Prefer results with more math symbols
-            math_symbols = '+-*/=()'
-            best_result = max(results, key=lambda x: sum(1 for c in x if c in math_symbols) + len(x))
-            # Post-process the result
-            processed_result = post_process_ocr_text(best_result)
-            print(f"OCR OUTPUT (best of {len(results)} attempts): {best_result}")
-            print(f"Post-processed result: {processed_result}")
-            
-            if not re.search(r'[+\-*/^=]', processed_result):
-                return jsonify({'error': 'No math operator detected in OCR output.', 'ocr_output': best_result, 'postprocessed': processed_result})
-            else:
-                clean_math = processed_result.strip()
-                print("🧮 Sending to SymPy:", clean_math)
-                result, steps, error = try_sympy_solve(clean_math)
-                # Convert result to string for JSON serialization
-                result_str = str(result) if result is not None else None
-                return jsonify({'ocr_output': best_result, 'postprocessed': processed_result, 'result': result_str, 'steps': steps, 'error': error})
-        else:
-            # Try EasyOCR as fallback
-            print("Tesseract failed, trying EasyOCR fallback...")
-            easyocr_result = try_easyocr_fallback(pil_img)
-            if easyocr_result:
-                processed_easyocr = post_process_ocr_text(easyocr_result)
-                return jsonify({'text': processed_easyocr})
-            else:
-                print("All OCR methods failed to extract any text")
-                return jsonify({'text': ''})
+        payload = run_ocr_pipeline(gray)
+        # An empty extraction may be a transient model failure; don't pin it
+        if payload != {'text': ''}:
+            _ocr_cache_put(cache_key, payload)
+        return jsonify(payload)
             
     except Exception as e:
         print(f"OCR error: {e}")
@@ -253,17 +379,8 @@ def calculate():
 @app.route('/shapes', methods=['GET'])
 def get_shapes():
     """Get list of supported shapes and their required parameters."""
-    try:
-        supported_shapes = get_supported_shapes()
-        return jsonify({
-            'shapes': supported_shapes,
-            'success': True
-        })
-    except Exception as e:
-        return jsonify({
-            'error': f'Error retrieving shapes: {str(e)}',
-            'success': False
-        }), 500
+    return Response(_SHAPES_JSON, mimetype='application/json',
+                    headers={'Cache-Control': 'public, max-age=86400'})
 
 @app.route('/solve', methods=['POST'])
 def solve():
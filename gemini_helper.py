@@ -1,13 +1,22 @@
 import os
+from functools import lru_cache
 import google.generativeai as genai
 
+# Read the API key once at import; fall back to the placeholder if unset
+_API_KEY = os.environ.get('GOOGLE_API_KEY') or 'xyz put your api key here'
+genai.configure(api_key=_API_KEY)
+
+# Building the model parses its config, so one instance is shared by all calls
+_MODEL = genai.GenerativeModel("models/gemini-1.5-flash-latest")
+
+@lru_cache(maxsize=256)
+def _generate_explanation(prompt):
+    # Failed calls raise and are therefore never cached
+    response = _MODEL.generate_content(prompt)
+    return response.text if hasattr(response, 'text') else str(response)
+
 def get_gemini_explanation(prompt):
-    # Set API key from environment variable if not already set
-    if 'GOOGLE_API_KEY' not in os.environ:
-        os.environ['GOOGLE_API_KEY'] = 'xyz put your api key here'
     try:
-        model = genai.GenerativeModel("models/gemini-1.5-flash-latest")
-        response = model.generate_content(prompt)
-        return response.text if hasattr(response, 'text') else str(response)
+        return _generate_explanation(prompt)
     except Exception as e:
         return f"Gemini error: {e}" 
@@ -1,11 +1,35 @@
+import ast
+import math
 import sympy as sp
 import re
 import logging
+from functools import lru_cache
 
 # Set up logging for debugging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fix common OCR mistakes that might have been missed; translate handles the
+# multi-character replacements too, so this is a single pass over the string
+_CLEAN_TRANS = str.maketrans({
+    'l': '1',      # lowercase L
+    'I': '1',      # uppercase I
+    'O': '0',      # uppercase O
+    'o': '0',      # lowercase o
+    '×': '*',      # multiplication symbol
+    '÷': '/',      # division symbol
+    '−': '-',      # minus sign
+    '²': '^2',     # squared
+    '³': '^3',     # cubed
+    '√': 'sqrt',   # square root
+    'π': 'pi',     # pi
+    '∞': 'oo',     # infinity
+})
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_NUMBER_BEFORE_OP_RE = re.compile(r'(\d+)([+\-*/^=])')
+_NUMBER_AFTER_OP_RE = re.compile(r'([+\-*/^=])(\d+)')
+
 def clean_math_expression(expr):
     """
     Clean and normalize math expression for better parsing.
@@ -14,39 +38,29 @@ def clean_math_expression(expr):
         return ""
     
     # Remove extra whitespace
-    expr = re.sub(r'\s+', ' ', expr.strip())
+    expr = _WHITESPACE_RE.sub(' ', expr.strip())
     
     # Remove trailing dots/periods that cause syntax errors
     expr = expr.rstrip('.')
     
-    # Fix common OCR mistakes that might have been missed
-    replacements = {
-        'l': '1',      # lowercase L
-        'I': '1',      # uppercase I
-        'O': '0',      # uppercase O
-        'o': '0',      # lowercase o
-        '×': '*',      # multiplication symbol
-        '÷': '/',      # division symbol
-        '−': '-',      # minus sign
-        '²': '^2',     # squared
-        '³': '^3',     # cubed
-        '√': 'sqrt',   # square root
-        'π': 'pi',     # pi
-        '∞': 'oo',     # infinity
-    }
-    
-    for old, new in replacements.items():
-        expr = expr.replace(old, new)
+    expr = expr.translate(_CLEAN_TRANS)
     
     # Fix spacing around operators
-    expr = re.sub(r'(\d+)([+\-*/^=])', r'\1 \2', expr)
-    expr = re.sub(r'([+\-*/^=])(\d+)', r'\1 \2', expr)
-    
-    # Fix function calls
-    expr = re.sub(r'(\w+)\(', r'\1(', expr)
+    expr = _NUMBER_BEFORE_OP_RE.sub(r'\1 \2', expr)
+    expr = _NUMBER_AFTER_OP_RE.sub(r'\1 \2', expr)
     
     return expr
 
+# Applied in order, matching the original one-pattern-at-a-time loop
+_TRIG_RES = [
+    (re.compile(r'sin\(([^)]+)\)'), r'sin((\1)*pi/180)'),
+    (re.compile(r'cos\(([^)]+)\)'), r'cos((\1)*pi/180)'),
+    (re.compile(r'tan\(([^)]+)\)'), r'tan((\1)*pi/180)'),
+    (re.compile(r'asin\(([^)]+)\)'), r'asin((\1)*pi/180)'),
+    (re.compile(r'acos\(([^)]+)\)'), r'acos((\1)*pi/180)'),
+    (re.compile(r'atan\(([^)]+)\)'), r'atan((\1)*pi/180)'),
+]
+
 def degrees_to_radians(expr):
     """
     Convert degree-based trigonometric functions to radians.
@@ -54,21 +68,21 @@ def degrees_to_radians(expr):
     if not expr:
         return expr
     
-    # More robust pattern matching for trig functions
-    patterns = [
-        (r'sin\(([^)]+)\)', r'sin((\1)*pi/180)'),
-        (r'cos\(([^)]+)\)', r'cos((\1)*pi/180)'),
-        (r'tan\(([^)]+)\)', r'tan((\1)*pi/180)'),
-        (r'asin\(([^)]+)\)', r'asin((\1)*pi/180)'),
-        (r'acos\(([^)]+)\)', r'acos((\1)*pi/180)'),
-        (r'atan\(([^)]+)\)', r'atan((\1)*pi/180)'),
-    ]
-    
-    for pattern, replacement in patterns:
-        expr = re.sub(pattern, replacement, expr)
+    for pattern, replacement in _TRIG_RES:
+        expr = pattern.sub(replacement, expr)
     
     return expr
 
+# Pattern to match variable names (letters, possibly with subscripts)
+_VARIABLE_RE = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
+
+# Common function names and constants that are not variables
+_NON_VARIABLE_NAMES = frozenset({
+    'sin', 'cos', 'tan', 'asin', 'acos', 'atan',
+    'sqrt', 'log', 'ln', 'exp', 'abs',
+    'pi', 'e', 'oo', 'inf', 'nan'
+})
+
 def extract_variables_from_expression(expr):
     """
     Extract variable names from a mathematical expression.
@@ -76,25 +90,16 @@ def extract_variables_from_expression(expr):
     if not expr:
         return set()
     
-    # Pattern to match variable names (letters, possibly with subscripts)
-    var_pattern = r'\b[a-zA-Z_][a-zA-Z0-9_]*\b'
-    variables = set(re.findall(var_pattern, expr))
-    
-    # Remove common function names and constants
-    excluded = {
-        'sin', 'cos', 'tan', 'asin', 'acos', 'atan',
-        'sqrt', 'log', 'ln', 'exp', 'abs',
-        'pi', 'e', 'oo', 'inf', 'nan'
-    }
+    variables = set(_VARIABLE_RE.findall(expr))
     
-    return variables - excluded
+    return variables - _NON_VARIABLE_NAMES
 
-def substitute_labels(expr, labels):
+def label_substitutions(expr, labels):
     """
-    Substitute label values into expression, ignoring irrelevant labels.
+    Map each variable in the expression to its label value, ignoring irrelevant labels.
     """
     if not expr or not labels:
-        return expr
+        return {}
     
     # Extract variables from the expression
     expr_variables = extract_variables_from_expression(expr)
@@ -125,7 +130,12 @@ def substitute_labels(expr, labels):
             except (ValueError, TypeError):
                 logger.warning(f"Invalid label format: {lab['text']}")
     
-    # Apply substitutions
+    return subs
+
+def apply_substitutions(expr, subs):
+    """
+    Write substitution values into the expression string.
+    """
     for var, val in subs.items():
         # Use word boundaries to avoid partial matches
         pattern = rf'\b{re.escape(var)}\b'
@@ -133,6 +143,16 @@ def substitute_labels(expr, labels):
     
     return expr
 
+def substitute_labels(expr, labels):
+    """
+    Substitute label values into expression, ignoring irrelevant labels.
+    """
+    return apply_substitutions(expr, label_substitutions(expr, labels))
+
+_QUESTION_WORDS_RE = re.compile(r'(?:what\s+is|calculate|solve|find)\s+', re.IGNORECASE)
+_TRAILING_EQUALS_QUESTION_RE = re.compile(r'=\s*\?$')
+_TRAILING_QUESTION_RE = re.compile(r'\?$')
+
 def preprocess_question(question):
     """
     Preprocess the question to extract the mathematical expression.
@@ -141,15 +161,132 @@ def preprocess_question(question):
         return ""
     
     # Remove question words and punctuation
-    question = re.sub(r'what\s+is\s+', '', question, flags=re.IGNORECASE)
-    question = re.sub(r'calculate\s+', '', question, flags=re.IGNORECASE)
-    question = re.sub(r'solve\s+', '', question, flags=re.IGNORECASE)
-    question = re.sub(r'find\s+', '', question, flags=re.IGNORECASE)
-    question = re.sub(r'=\s*\?$', '', question)
-    question = re.sub(r'\?$', '', question)
+    question = _QUESTION_WORDS_RE.sub('', question)
+    question = _TRAILING_EQUALS_QUESTION_RE.sub('', question)
+    question = _TRAILING_QUESTION_RE.sub('', question)
     
     return question.strip()
 
+_DIGIT_RE = re.compile(r'\d')
+_OPERATOR_RE = re.compile(r'[+\-*/^=]')
+_FUNCTION_RE = re.compile(r'\b(sin|cos|tan|sqrt|log|ln|exp)\b', re.IGNORECASE)
+
+# Token-level scan so OCR garbage is rejected before SymPy builds anything.
+# Alternation order matters: '**', '<=' and '>=' must win over their prefixes.
+_TOKEN_RE = re.compile(
+    r'(?P<ws>\s+)|(?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+\-]?\d+)?)|(?P<name>[^\W\d]\w*)'
+    r'|(?P<op>\*\*|<=|>=|[*/^%<>])|(?P<sign>[+\-])|(?P<other>.)'
+)
+
+# Largest numeric exponent accepted. x = 2**2000 still solves exactly, while
+# an exact power like x = 9**99999999 keeps SymPy busy indefinitely
+_MAX_EXPONENT = 10000
+
+def _operand_end(tokens, start):
+    """
+    Index just past the operand starting at tokens[start]: any unary signs,
+    then a number, a name (with its call arguments) or a parenthesised group,
+    then any '!'.
+    """
+    i = start
+    while tokens[i][0] == 'sign':
+        i += 1
+    if tokens[i][0] == 'name' and i + 1 < len(tokens) and tokens[i + 1][1] == '(':
+        i += 1
+    if tokens[i][1] == '(':
+        depth = 0
+        while True:
+            if tokens[i][1] == '(':
+                depth += 1
+            elif tokens[i][1] == ')':
+                depth -= 1
+                if not depth:
+                    break
+            i += 1
+    i += 1
+    while i < len(tokens) and tokens[i][1] == '!':
+        i += 1
+    return i
+
+def _check_powers(tokens):
+    """
+    Reject powers SymPy can't finish: a power inside an exponent (9**9**9,
+    2**(3**4)) or a numeric exponent beyond _MAX_EXPONENT. Symbols elsewhere
+    don't help, so this runs whether or not the expression is numeric.
+    """
+    for i, (_, text) in enumerate(tokens):
+        if text != '**':
+            continue
+        end = _operand_end(tokens, i + 1)
+        exponent = tokens[i + 1:end]
+        if (end < len(tokens) and tokens[end][1] == '**') or any(t == '**' for _, t in exponent):
+            return "Nested powers are not supported"
+        value = evaluate_numeric(''.join(t for _, t in exponent))
+        if value is not None and abs(value) > _MAX_EXPONENT:
+            return "Exponent too large"
+    return None
+
+def _scan_tokens(expr):
+    """
+    Walk the expression once, tracking whether an operand is expected next.
+    Returns an error message, or None if the token sequence is well formed.
+    """
+    expect_operand = True
+    depth = 0
+    equals = 0
+    prev = None
+    tokens = [(m.lastgroup, m.group()) for m in _TOKEN_RE.finditer(expr) if m.lastgroup != 'ws']
+    for i, (kind, text) in enumerate(tokens):
+        if kind in ('number', 'name'):
+            if not expect_operand:
+                return f"Missing operator before '{text}'"
+            if kind == 'name' and i + 1 < len(tokens) and tokens[i + 1][1] == '(':
+                if text not in _KNOWN_FUNCTIONS:
+                    return f"Unknown function '{text}'"
+            expect_operand = False
+        elif kind == 'sign':
+            # Unary when an operand is expected, binary otherwise
+            expect_operand = True
+        elif kind == 'op':
+            if expect_operand:
+                return "Consecutive operators"
+            expect_operand = True
+        elif text == '(':
+            if not expect_operand and prev != 'name':
+                return "Missing operator before '('"
+            depth += 1
+            expect_operand = True
+        elif text == ')':
+            if prev == '(':
+                return "Empty parentheses"
+            if expect_operand:
+                return "Missing operand before ')'"
+            depth -= 1
+            if depth < 0:
+                return "Unbalanced parentheses"
+        elif text == '!':
+            if expect_operand:
+                return "Missing operand before '!'"
+        elif text == '=':
+            equals += 1
+            if equals > 1:
+                return "More than one '='"
+            if expect_operand or depth:
+                return "Misplaced '='"
+            expect_operand = True
+        elif text == ',':
+            if expect_operand or not depth:
+                return "Misplaced ','"
+            expect_operand = True
+        else:
+            return f"Unexpected character '{text}'"
+        prev = kind if kind in ('number', 'name') else text
+    if depth:
+        return "Unbalanced parentheses"
+    if expect_operand:
+        return "Missing operand at end of expression"
+    return _check_powers(tokens)
+
 def validate_expression(expr):
     """
     Validate if an expression is likely to be a valid mathematical expression.
@@ -158,9 +295,9 @@ def validate_expression(expr):
         return False, "Empty expression"
     
     # Check for basic mathematical structure
-    has_numbers = bool(re.search(r'\d', expr))
-    has_operators = bool(re.search(r'[+\-*/^=]', expr))
-    has_functions = bool(re.search(r'\b(sin|cos|tan|sqrt|log|ln|exp)\b', expr, re.IGNORECASE))
+    has_numbers = _DIGIT_RE.search(expr) is not None
+    has_operators = _OPERATOR_RE.search(expr) is not None
+    has_functions = _FUNCTION_RE.search(expr) is not None
     
     if not (has_numbers or has_functions):
         return False, "No numbers or functions found"
@@ -169,17 +306,164 @@ def validate_expression(expr):
     if expr.count('(') != expr.count(')'):
         return False, "Unbalanced parentheses"
     
-    # Check for consecutive operators (except for negative numbers)
-    if re.search(r'[+\-*/^]{2,}', expr):
-        return False, "Consecutive operators"
+    # Check operator/operand order, known function names and stray characters
+    error = _scan_tokens(expr)
+    if error:
+        return False, error
     
     return True, "Valid expression"
 
+# Plain arithmetic (the common case once labels are substituted) is evaluated
+# with float math; SymPy is only needed for symbols, equations and anything
+# outside this whitelist. Trig, log and exp stay with SymPy so exact values
+# such as sin(180 degrees) = 0 don't come back as float noise.
+_NUMERIC_NAMESPACE = {
+    'sqrt': math.sqrt, 'abs': abs, 'pi': math.pi,
+    '__builtins__': {},
+}
+_NUMERIC_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load,
+    ast.Constant, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+)
+
+class _FloatConstants(ast.NodeTransformer):
+    # Integer literals become floats so eval overflows on 9**9**9 instead of
+    # building the exact integer; the expression then goes to SymPy
+    def visit_Constant(self, node):
+        return ast.copy_location(ast.Constant(float(node.value)), node)
+
+@lru_cache(maxsize=512)
+def _compile_numeric(expr):
+    """
+    Code object for a purely numeric expression, or None if it needs SymPy.
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return None
+    for node in ast.walk(tree):
+        if not isinstance(node, _NUMERIC_NODES):
+            return None
+        if isinstance(node, ast.Name) and node.id not in _NUMERIC_NAMESPACE:
+            return None
+        if isinstance(node, ast.Call) and (node.keywords or not isinstance(node.func, ast.Name)):
+            return None
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            return None
+    tree = ast.fix_missing_locations(_FloatConstants().visit(tree))
+    return compile(tree, '<expr>', 'eval')
+
+def evaluate_numeric(expr):
+    """
+    Evaluate a numeric expression with float math.
+    Returns a SymPy Float, or None when the expression should go through SymPy.
+    """
+    code = _compile_numeric(expr)
+    if code is None:
+        return None
+    try:
+        value = eval(code, _NUMERIC_NAMESPACE)
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    if not isinstance(value, float) or not math.isfinite(value):
+        return None
+    return sp.Float(value)
+
+# Names SymPy should resolve without its default namespace lookup. 'e' stays a
+# plain symbol, as it is for parse_expr and the numeric fast path.
+_SYMPY_LOCALS = {
+    'sin': sp.sin, 'cos': sp.cos, 'tan': sp.tan,
+    'asin': sp.asin, 'acos': sp.acos, 'atan': sp.atan,
+    'sqrt': sp.sqrt, 'log': sp.log, 'ln': sp.log, 'exp': sp.exp,
+    'abs': sp.Abs, 'pi': sp.pi, 'oo': sp.oo,
+}
+
+# Function names the validator lets through to parse_expr, which could otherwise
+# call anything in SymPy's namespace (plot, preview, var, init_printing, ...)
+_KNOWN_FUNCTIONS = frozenset(
+    name for name, value in {**_SYMPY_LOCALS, **_NUMERIC_NAMESPACE}.items() if callable(value)
+) | {'sinh', 'cosh', 'tanh', 'sec', 'csc', 'cot', 'factorial', 'floor', 'ceiling', 'Abs', 'Min', 'Max'}
+
+@lru_cache(maxsize=256)
+def _parse(src, symbols=()):
+    """
+    parse_expr with the shared symbol table; names in `symbols` are forced to
+    plain Symbols so a label called E or N isn't read as a SymPy builtin.
+    SymPy expressions are immutable, so cached results are safe to share.
+    """
+    local_dict = dict(_SYMPY_LOCALS)
+    local_dict.update((name, sp.Symbol(name)) for name in symbols)
+    return sp.parse_expr(src, local_dict=local_dict, evaluate=False)
+
+def _parse_with_labels(template, substituted, subs):
+    """
+    Parse the expression with its variables intact and substitute the label
+    values on the SymPy tree. Falls back to parsing the regex-substituted
+    string if the template can't be parsed or substituted (e.g. '^' parses
+    to a Xor node whose subs() raises).
+    """
+    if not subs:
+        return _parse(substituted)
+    try:
+        expr = _parse(template, tuple(subs))
+        return expr.subs({sp.Symbol(name): value for name, value in subs.items()})
+    except Exception:
+        logger.info(f"Could not substitute into '{template}', using substituted string")
+        return _parse(substituted)
+
+@lru_cache(maxsize=256)
+def _solve_equation(eq):
+    """
+    sp.solve for an equation, cached on the (hashable) equation itself.
+    """
+    return tuple(sp.solve(eq))
+
+def _labels_key(labels):
+    """
+    Hashable form of the labels, keeping only what substitute_labels reads.
+    Order is kept because a later label for the same variable wins.
+    """
+    if not labels:
+        return ()
+    key = []
+    for lab in labels:
+        if not isinstance(lab, dict) or 'text' not in lab:
+            continue
+        if 'value' in lab:
+            key.append((str(lab['text']), True, lab['value']))
+        else:
+            key.append((str(lab['text']), False, None))
+    key = tuple(key)
+    hash(key)  # raises TypeError for unhashable label values
+    return key
+
 def try_sympy_solve(question, labels=None):
     """
     Try to solve a math problem using SymPy with robust error handling.
     Returns (result, steps, error). If cannot solve, result is None and error is set.
     """
+    try:
+        labels_key = _labels_key(labels)
+    except TypeError:
+        return _solve_uncached(question, labels)
+    result, steps, error = _solve_cached(question, labels_key)
+    # Lists are cached as tuples so the shared entry can't be mutated
+    if isinstance(result, tuple):
+        result = list(result)
+    return result, steps, error
+
+@lru_cache(maxsize=512)
+def _solve_cached(question, labels_key):
+    labels = [
+        {'text': text, 'value': value} if has_value else {'text': text}
+        for text, has_value, value in labels_key
+    ]
+    result, steps, error = _solve_uncached(question, labels)
+    if isinstance(result, list):
+        result = tuple(result)
+    return result, steps, error
+
+def _solve_uncached(question, labels=None):
     result = None
     steps = None
     error = None
@@ -199,7 +483,8 @@ def try_sympy_solve(question, labels=None):
         logger.info(f"After cleaning: '{question}'")
         
         # Step 3: Substitute labels
-        question_sub = substitute_labels(question, labels)
+        subs = label_substitutions(question, labels)
+        question_sub = apply_substitutions(question, subs)
         logger.info(f"After label substitution: '{question_sub}'")
         
         # Step 4: Validate the expression
@@ -208,6 +493,7 @@ def try_sympy_solve(question, labels=None):
             return None, None, f"Invalid expression: {validation_msg}"
         
         # Step 5: Convert degrees to radians
+        question = degrees_to_radians(question)
         question_sub = degrees_to_radians(question_sub)
         logger.info(f"After degree conversion: '{question_sub}'")
         
@@ -217,34 +503,41 @@ def try_sympy_solve(question, labels=None):
             left, right = question_sub.split('=', 1)
             left = left.strip()
             right = right.strip()
+            left_template, right_template = (side.strip() for side in question.split('=', 1))
             
             logger.info(f"Parsing equation: {left} = {right}")
             
             # Parse with evaluate=False for more control
-            left_expr = sp.parse_expr(left, evaluate=False)
-            right_expr = sp.parse_expr(right, evaluate=False)
+            left_expr = _parse_with_labels(left_template, left, subs)
+            right_expr = _parse_with_labels(right_template, right, subs)
             
             eq = sp.Eq(left_expr, right_expr)
-            sol = sp.solve(eq)
+            sol = list(_solve_equation(eq))
             
             result = sol
             steps = f"Equation: {eq}\nSolution: {sol}"
             
         else:
             # Handle expressions
-            logger.info(f"Parsing expression: {question_sub}")
-            
-            # Parse with evaluate=False for more control
-            expr = sp.parse_expr(question_sub, evaluate=False)
-            
-            # Try to evaluate
-            if hasattr(expr, 'evalf'):
-                val = expr.evalf()
+            val = evaluate_numeric(question_sub)
+            if val is not None:
+                logger.info(f"Evaluated numerically: {question_sub}")
+                result = val
+                steps = f"Expression: {question_sub}\nValue: {val}"
             else:
-                val = str(expr)
-            
-            result = val
-            steps = f"Expression: {expr}\nValue: {val}"
+                logger.info(f"Parsing expression: {question_sub}")
+                
+                # Parse with evaluate=False for more control
+                expr = _parse_with_labels(question, question_sub, subs)
+                
+                # Try to evaluate
+                if hasattr(expr, 'evalf'):
+                    val = expr.evalf()
+                else:
+                    val = str(expr)
+                
+                result = val
+                steps = f"Expression: {expr}\nValue: {val}"
         
         logger.info(f"Successfully solved: {result}")
         
@@ -1,96 +1,277 @@
+import os
 import re
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import lru_cache
 from transformers import TrOCRProcessor, VisionEncoderDecoderModel
-from PIL import ImageOps,Image 
+from PIL import Image
 import torch
 import numpy as np
 import cv2
-from typing import Union, Tuple
+from typing import List, Union, Tuple
 
-# Load both models for comparison
-processor_handwritten = TrOCRProcessor.from_pretrained('microsoft/trocr-base-handwritten')
-model_handwritten = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-handwritten')
+logger = logging.getLogger(__name__)
 
-processor_printed = TrOCRProcessor.from_pretrained('microsoft/trocr-base-printed')
-model_printed = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-printed')
+# DEBUG_TROCR=1 writes debug_preprocessed.png and logs every OCR result;
+# otherwise the request path does no disk writes and no per-call output
+DEBUG_TROCR = bool(os.environ.get('DEBUG_TROCR'))
+if DEBUG_TROCR:
+    logger.setLevel(logging.DEBUG)
 
-def preprocess_image_for_trocr(image: Image.Image) -> Image.Image:
-    image = image.convert("RGB")
-    image = image.resize((384, 384), resample=Image.BICUBIC)
-    image = ImageOps.invert(image)
-    image = image.convert("L").point(lambda x: 0 if x < 128 else 255)
-    image = image.convert("RGB")
-    return image
+# Run on the GPU in half precision when one is available, otherwise fp32 on CPU
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DTYPE = torch.float16 if DEVICE == "cuda" else torch.float32
 
+# CPU inference threads; PyTorch's default (one per physical core) unless overridden
+if DEVICE == "cpu" and os.environ.get('TROCR_NUM_THREADS'):
+    torch.set_num_threads(int(os.environ['TROCR_NUM_THREADS']))
+
+# Math expressions are a few tokens long: greedy decoding with a short cap
+# instead of the checkpoint's generation defaults
+GENERATE_KWARGS = {
+    'num_beams': 1,
+    'do_sample': False,
+    'max_new_tokens': 32,
+    'use_cache': True,
+}
+
+def _autocast():
+    if DEVICE == "cuda":
+        return torch.autocast(device_type="cuda", dtype=DTYPE)
+    return nullcontext()
+
+def _warmup(model) -> None:
+    """Run one dummy generate() so CUDA kernel selection happens before the first request."""
+    dummy = torch.zeros((1, 3, 384, 384), device=DEVICE, dtype=DTYPE)
+    with torch.inference_mode(), _autocast():
+        model.generate(dummy, max_new_tokens=1)
+
+# Models are loaded on first use, so a process that only ever reads
+# handwriting never pays for the printed checkpoint (and vice versa)
+_MODEL_NAMES = {
+    False: 'microsoft/trocr-base-handwritten',
+    True: 'microsoft/trocr-base-printed',
+}
+_MODELS = {}
+_models_lock = threading.Lock()
+
+# Optional CPU backend: TROCR_BACKEND=onnx runs generate() through ONNX Runtime
+# (requires: pip install optimum[onnxruntime]). The export is saved under
+# ONNX_MODEL_DIR so only the first run pays for it.
+TROCR_BACKEND = os.environ.get('TROCR_BACKEND', 'torch').lower()
+ONNX_MODEL_DIR = os.environ.get('TROCR_ONNX_DIR', 'onnx_models')
+
+def _load_onnx_model(name: str):
+    from optimum.onnxruntime import ORTModelForVision2Seq
+
+    export_dir = os.path.join(ONNX_MODEL_DIR, name.replace('/', '__'))
+    if os.path.isdir(export_dir):
+        return ORTModelForVision2Seq.from_pretrained(export_dir, provider='CPUExecutionProvider')
+    model = ORTModelForVision2Seq.from_pretrained(name, export=True, provider='CPUExecutionProvider')
+    model.save_pretrained(export_dir)
+    return model
+
+def _load_torch_model(name: str):
+    model = VisionEncoderDecoderModel.from_pretrained(name)
+    model.config.use_cache = True
+    model.to(DEVICE, dtype=DTYPE).eval()
+    if DEVICE == "cuda":
+        _warmup(model)
+    return model
+
+def _load_model(name: str):
+    if TROCR_BACKEND == 'onnx' and DEVICE == "cpu":
+        try:
+            return _load_onnx_model(name)
+        except ImportError:
+            logger.warning("optimum[onnxruntime] not installed, using the PyTorch TrOCR model")
+    return _load_torch_model(name)
+
+def _get_model(use_printed_model: bool):
+    """(processor, model) for the requested checkpoint, loading it once."""
+    loaded = _MODELS.get(use_printed_model)
+    if loaded is not None:
+        return loaded
+    with _models_lock:
+        if use_printed_model not in _MODELS:
+            name = _MODEL_NAMES[use_printed_model]
+            _MODELS[use_printed_model] = (TrOCRProcessor.from_pretrained(name), _load_model(name))
+        return _MODELS[use_printed_model]
+
+TROCR_INPUT_SIZE = 384
+
+def preprocess_image_for_trocr(image: Union[Image.Image, np.ndarray]) -> Image.Image:
+    # Work on a single grayscale buffer: 2-D arrays (the app's decoded uploads)
+    # are used as-is, anything else goes through PIL's L conversion once
+    if isinstance(image, np.ndarray) and image.ndim == 2:
+        gray = image
+    else:
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        gray = np.asarray(image.convert("L"))
+    shrinking = gray.shape[0] > TROCR_INPUT_SIZE or gray.shape[1] > TROCR_INPUT_SIZE
+    resized = cv2.resize(gray, (TROCR_INPUT_SIZE, TROCR_INPUT_SIZE),
+                         interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC)
+    # Invert and binarize in place: a pixel brighter than mid-grey becomes
+    # black text on white once inverted and thresholded
+    cv2.threshold(resized, 127, 255, cv2.THRESH_BINARY_INV, dst=resized)
+    return Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_GRAY2RGB))
+
+# Lookahead so runs like 1.2,3 are handled in a single pass
+_PUNCT_BETWEEN_DIGITS_RE = re.compile(r'(\d)\s*[.,:]\s*(?=\d)')
+_MATH_OP_RE = re.compile(r'[+\-*/^=]')
+_NUMBER_RE = re.compile(r'\d+')
+_NON_MATH_CHARS_RE = re.compile(r'[^0-9a-z+\-*/^=(). ]')
+_OCR_FIX_TRANS = str.maketrans({
+    't': '+',  # 't' often misread as '+'
+    'l': '1',  # 'l' often misread as '1'
+    'o': '0',  # 'o' often misread as '0'
+    's': '5',  # 's' often misread as '5'
+})
+
+@lru_cache(maxsize=1024)
 def clean_math_ocr_output(text: str) -> str:
-    text = text.lower().strip()
-    
-    # Fix common OCR mistakes
-    text = text.replace("t", "+")  # 't' often misread as '+'
-    text = text.replace("l", "1")  # 'l' often misread as '1'
-    text = text.replace("o", "0")  # 'o' often misread as '0'
-    text = text.replace("s", "5")  # 's' often misread as '5'
+    # Fix common OCR mistakes in a single translate pass
+    text = text.lower().strip().translate(_OCR_FIX_TRANS)
     
     # Remove trailing dots/periods that cause syntax errors
     text = text.rstrip('.')
     
     # More aggressive operator detection and replacement
     # If we have two numbers separated by a single character, it's likely an operator
-    text = re.sub(r'(\d)\s*\.\s*(\d)', r'\1-\2', text)  # period between numbers → minus
-    text = re.sub(r'(\d)\s*,\s*(\d)', r'\1-\2', text)  # comma between numbers → minus
-    text = re.sub(r'(\d)\s*:\s*(\d)', r'\1-\2', text)  # colon between numbers → minus
+    text = _PUNCT_BETWEEN_DIGITS_RE.sub(r'\1-', text)  # period/comma/colon between numbers → minus
     
     # If still no operator and two numbers separated by space, add plus
     '''
     if not re.search(r'[+\-*/^=]', text):
         text = re.sub(r'(\d)\s+(\d)', r'\1+\2', text)
     '''
-    if not re.search(r'[+\-*/^=]', text):
-        nums = re.findall(r'\d+', text)
+    if not _MATH_OP_RE.search(text):
+        nums = _NUMBER_RE.findall(text)
         if len(nums) == 2 and len(text.split()) == 2:
             text = f"{nums[0]}+{nums[1]}"
     
     # Remove any remaining non-math characters
-    text = re.sub(r'[^0-9a-z+\-*/^=(). ]', '', text)
+    text = _NON_MATH_CHARS_RE.sub('', text)
     
-    # Clean up extra spaces
-    text = re.sub(r'\s+', ' ', text).strip()
+    # Clean up extra spaces (only ' ' survives the filter above)
+    text = ' '.join(text.split())
     
     return text
 
-def extract_clean_math_from_image(image_input: Union[str, Image.Image], use_printed_model: bool = False) -> Tuple[str, str]:
+def _load_image(image_input: Union[str, Image.Image, np.ndarray]) -> Union[Image.Image, np.ndarray]:
     if isinstance(image_input, str):
-        image = Image.open(image_input)
-    elif isinstance(image_input, Image.Image):
-        image = image_input
+        return Image.open(image_input)
+    elif isinstance(image_input, (Image.Image, np.ndarray)):
+        return image_input
+    raise ValueError("image_input must be a file path, PIL Image or numpy array")
+
+def _select_model(use_printed_model: bool):
+    # Choose model based on parameter
+    if use_printed_model:
+        logger.debug("📝 Using printed model")
     else:
-        raise ValueError("image_input must be a file path or PIL Image")
+        logger.debug("✍️ Using handwritten model")
+    return _get_model(use_printed_model)
 
-    try:
-        preprocessed = preprocess_image_for_trocr(image)
-        preprocessed.save("debug_preprocessed.png")
-        print("🔍 Saved preprocessed image as debug_preprocessed.png")
-        
-        # Choose model based on parameter
-        if use_printed_model:
-            processor = processor_printed
-            model = model_printed
-            print("📝 Using printed model")
-        else:
-            processor = processor_handwritten
-            model = model_handwritten
-            print("✍️ Using handwritten model")
+# TrOCR generation dominates OCR latency, so raw outputs are cached per
+# preprocessed image (bounded LRU keyed by a content hash and the model used)
+_TROCR_CACHE_SIZE = 128
+_trocr_cache = OrderedDict()
+_trocr_cache_lock = threading.Lock()
+
+def _cache_key(preprocessed: Image.Image, use_printed_model: bool) -> Tuple[bytes, bool]:
+    digest = hashlib.blake2b(preprocessed.tobytes(), digest_size=16).digest()
+    return digest, use_printed_model
+
+def _cache_get(key):
+    with _trocr_cache_lock:
+        text = _trocr_cache.get(key)
+        if text is not None:
+            _trocr_cache.move_to_end(key)
+        return text
+
+def _cache_put(key, text: str):
+    with _trocr_cache_lock:
+        _trocr_cache[key] = text
+        _trocr_cache.move_to_end(key)
+        if len(_trocr_cache) > _TROCR_CACHE_SIZE:
+            _trocr_cache.popitem(last=False)
+
+def _normalized_batch(image_processor, images: List[Image.Image]) -> np.ndarray:
+    """The processor's rescale + normalize for same-size RGB images, as one (N, H, W, 3) float32 array"""
+    # (x * rescale - mean) / std folded into one multiply-subtract per channel
+    std = np.asarray(image_processor.image_std, dtype=np.float32)
+    scale = np.float32(image_processor.rescale_factor) / std
+    offset = np.asarray(image_processor.image_mean, dtype=np.float32) / std
+    width, height = images[0].size
+    batch = np.empty((len(images), height, width, 3), dtype=np.float32)
+    for k, image in enumerate(images):
+        batch[k] = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+    batch *= scale
+    batch -= offset
+    return batch
+
+def _pixel_values(processor, images: List[Image.Image]) -> torch.Tensor:
+    """pixel_values for generate(), skipping the processor for our preprocessed images"""
+    image_processor = processor.image_processor
+    height, width = image_processor.size['height'], image_processor.size['width']
+    if not (image_processor.do_rescale and image_processor.do_normalize) or \
+            any(image.size != (width, height) for image in images):
+        # Not the inputs this fast path assumes: let the processor handle them
+        return processor(images=images, return_tensors="pt").pixel_values.to(DEVICE, dtype=DTYPE)
+    batch = _normalized_batch(image_processor, images)
+    return torch.from_numpy(batch).permute(0, 3, 1, 2).to(DEVICE, dtype=DTYPE)
+
+def _generate_texts(preprocessed: List[Image.Image], use_printed_model: bool) -> List[str]:
+    """Raw TrOCR text for each preprocessed image; only cache misses reach the model."""
+    keys = [_cache_key(image, use_printed_model) for image in preprocessed]
+    texts = [_cache_get(key) for key in keys]
+    misses = [i for i, text in enumerate(texts) if text is None]
+    if misses:
+        processor, model = _select_model(use_printed_model)
         
-        inputs = processor(images=preprocessed, return_tensors="pt").pixel_values.to("cpu")
-        model.to("cpu")
-        with torch.no_grad():
-            generated_ids = model.generate(inputs)
-        raw_ocr_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        cleaned = clean_math_ocr_output(raw_ocr_text)
-        print("🧠 OCR raw output:", repr(raw_ocr_text))
-        print("🧠 Cleaned math output:", repr(cleaned))
-        if not raw_ocr_text:
-            print("❌ TrOCR returned empty string.")
-        return raw_ocr_text, cleaned
+        with torch.inference_mode(), _autocast():
+            inputs = _pixel_values(processor, [preprocessed[i] for i in misses])
+            generated_ids = model.generate(inputs, pad_token_id=processor.tokenizer.pad_token_id,
+                                           **GENERATE_KWARGS)
+        for i, text in zip(misses, processor.batch_decode(generated_ids, skip_special_tokens=True)):
+            texts[i] = text
+            _cache_put(keys[i], text)
+    return texts
+
+def extract_clean_math_from_image(image_input: Union[str, Image.Image, np.ndarray], use_printed_model: bool = False) -> Tuple[str, str]:
+    """Single-image form of extract_clean_math_from_images; returns (raw, cleaned)."""
+    image = _load_image(image_input)
+    if DEBUG_TROCR:
+        preprocess_image_for_trocr(image).save("debug_preprocessed.png")
+        logger.debug("🔍 Saved preprocessed image as debug_preprocessed.png")
+    return extract_clean_math_from_images([image], use_printed_model)[0]
+
+def extract_clean_math_from_images(image_inputs: List[Union[str, Image.Image, np.ndarray]], use_printed_model: bool = False) -> List[Tuple[str, str]]:
+    """Run TrOCR over several images in a single batched generate() call.
+
+    Every image is preprocessed to the same 384x384 input, so the batch stacks
+    into one pixel_values tensor. Returns one (raw, cleaned) pair per input.
+    """
+    if not image_inputs:
+        return []
+    images = [_load_image(image_input) for image_input in image_inputs]
+
+    try:
+        preprocessed = [preprocess_image_for_trocr(image) for image in images]
+        outputs = []
+        for raw_ocr_text in _generate_texts(preprocessed, use_printed_model):
+            cleaned = clean_math_ocr_output(raw_ocr_text)
+            logger.debug("🧠 OCR raw output: %r", raw_ocr_text)
+            logger.debug("🧠 Cleaned math output: %r", cleaned)
+            if not raw_ocr_text:
+                logger.debug("❌ TrOCR returned empty string.")
+            outputs.append((raw_ocr_text, cleaned))
+        return outputs
     except Exception as e:
-        print(f"❌ ERROR during TrOCR inference: {e}")
-        return "", "" 
\ No newline at end of file
+        logger.error(f"❌ ERROR during TrOCR inference: {e}")
+        return [("", "")] * len(images)
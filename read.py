@@ -13,11 +13,145 @@ from pathlib import Path
 import json
 from datetime import datetime
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; classify_shapes then uses the NumPy version
+    njit = None
+
+# Shape codes produced by the classifier, indexed into SHAPE_NAMES
+SHAPE_UNKNOWN, SHAPE_TRIANGLE, SHAPE_SQUARE, SHAPE_RECTANGLE, SHAPE_CIRCLE, SHAPE_POLYGON = range(6)
+SHAPE_NAMES = ("Unknown", "Triangle", "Square", "Rectangle", "Circle", "Polygon")
+
+def _classify(area, perimeter, w, h, vertices):
+    """Return (shape code, confidence, aspect ratio, circularity) for one contour"""
+    aspect_ratio = w / h
+    
+    # Calculate circularity
+    circularity = 4 * np.pi * area / (perimeter * perimeter) if perimeter > 0 else 0.0
+    
+    if vertices == 3:
+        return SHAPE_TRIANGLE, 0.9, aspect_ratio, circularity
+    if vertices == 4:
+        if 0.95 <= aspect_ratio <= 1.05:
+            return SHAPE_SQUARE, 0.9, aspect_ratio, circularity
+        return SHAPE_RECTANGLE, 0.85, aspect_ratio, circularity
+    if vertices > 4:
+        if circularity > 0.7:
+            return SHAPE_CIRCLE, 0.8, aspect_ratio, circularity
+        return SHAPE_POLYGON, 0.7, aspect_ratio, circularity
+    return SHAPE_UNKNOWN, 0.5, aspect_ratio, circularity
+
+def _classify_shapes_loop(areas, perimeters, widths, heights, vertices,
+                          out_type, out_conf, out_aspect, out_circ):
+    for i in range(areas.shape[0]):
+        code, confidence, aspect_ratio, circularity = _classify(
+            areas[i], perimeters[i], widths[i], heights[i], vertices[i])
+        out_type[i] = code
+        out_conf[i] = confidence
+        out_aspect[i] = aspect_ratio
+        out_circ[i] = circularity
+
+# Confidence per shape code, for the NumPy classifier
+_SHAPE_CONFIDENCE = np.array([0.5, 0.9, 0.9, 0.85, 0.8, 0.7])
+
+def _classify_shapes_numpy(areas, perimeters, widths, heights, vertices,
+                           out_type, out_conf, out_aspect, out_circ):
+    # Same rules as _classify, evaluated over whole columns
+    aspect_ratio = widths / heights
+    with np.errstate(divide='ignore', invalid='ignore'):
+        circularity = np.where(perimeters > 0, 4 * np.pi * areas / (perimeters * perimeters), 0.0)
+    codes = np.select(
+        [vertices == 3,
+         (vertices == 4) & (aspect_ratio >= 0.95) & (aspect_ratio <= 1.05),
+         vertices == 4,
+         (vertices > 4) & (circularity > 0.7),
+         vertices > 4],
+        [SHAPE_TRIANGLE, SHAPE_SQUARE, SHAPE_RECTANGLE, SHAPE_CIRCLE, SHAPE_POLYGON],
+        default=SHAPE_UNKNOWN)
+    out_type[:] = codes
+    out_conf[:] = _SHAPE_CONFIDENCE[codes]
+    out_aspect[:] = aspect_ratio
+    out_circ[:] = circularity
+
+# classify_shapes fills the preallocated output arrays for every measured
+# contour: a compiled loop when numba is installed, vectorised NumPy otherwise
+if njit is not None:
+    _classify = njit(cache=True)(_classify)
+    classify_shapes = njit(cache=True)(_classify_shapes_loop)
+else:
+    classify_shapes = _classify_shapes_numpy
+
+# Column layout of the table analyze_all_shapes classifies and aggregates over;
+# the fields up to 'h' are in _shape_dict's argument order, 'contour' is the
+# index into the contour list
+SHAPE_DTYPE = np.dtype([
+    ('type_code', np.int64),
+    ('confidence', np.float64),
+    ('area', np.float64),
+    ('perimeter', np.float64),
+    ('vertices', np.int64),
+    ('aspect_ratio', np.float64),
+    ('circularity', np.float64),
+    ('x', np.int64),
+    ('y', np.int64),
+    ('w', np.int64),
+    ('h', np.int64),
+    ('contour', np.int64),
+])
+
+# The fields measure_contour returns, in its order, followed by the contour index
+_MEASURED_FIELDS = ('area', 'perimeter', 'vertices', 'x', 'y', 'w', 'h', 'contour')
+
+def _shape_counts(table):
+    """Count shapes per type name, in order of first appearance"""
+    # Polygons are named by their vertex count, so fold it into the key
+    is_polygon = table['type_code'] == SHAPE_POLYGON
+    keys = table['type_code'] + np.where(is_polygon, table['vertices'], 0) * len(SHAPE_NAMES)
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    return {
+        _shape_type(int(table['type_code'][first[k]]), int(table['vertices'][first[k]])): int(counts[k])
+        for k in order
+    }
+
+def _shape_type(code, vertices):
+    if code == SHAPE_POLYGON:
+        return f"Polygon ({vertices} sides)"
+    return SHAPE_NAMES[code]
+
+def _shape_dict(code, confidence, area, perimeter, vertices, aspect_ratio, circularity, x, y, w, h):
+    """Build the JSON-ready description of one classified shape.
+    
+    The arguments must already be Python scalars, as measure_contour and
+    _classify return them.
+    """
+    return {
+        'type': _shape_type(code, vertices),
+        'confidence': confidence,
+        'area': area,
+        'perimeter': perimeter,
+        'vertices': vertices,
+        'aspect_ratio': aspect_ratio,
+        'circularity': circularity,
+        'bounding_box': {
+            'x': x,
+            'y': y,
+            'width': w,
+            'height': h
+        },
+        'centroid': {
+            'x': int(x + w/2),
+            'y': int(y + h/2)
+        }
+    }
+
 class DiagramAnalyzer:
     def __init__(self, image_path=None, image_array=None):
         self.image_path = image_path
         self.image = None
         self.gray = None
+        # analyze_all_shapes output aligned with its contours (None = skipped)
+        self.contour_shapes = []
         self.results = {
             'timestamp': datetime.now().isoformat(),
             'image_path': image_path,
@@ -42,44 +176,47 @@ class DiagramAnalyzer:
             # Already loaded from array
             return True
         try:
-            self.image = cv2.imread(self.image_path)
-            if self.image is None:
+            # Decode straight to grayscale; the color image is only needed for
+            # the visualization and is read on demand by _ensure_color
+            self.gray = cv2.imread(self.image_path, cv2.IMREAD_GRAYSCALE)
+            if self.gray is None:
                 raise ValueError(f"Could not load image from {self.image_path}")
             
             self.results['image_size'] = {
-                'width': self.image.shape[1],
-                'height': self.image.shape[0],
-                'channels': self.image.shape[2]
+                'width': self.gray.shape[1],
+                'height': self.gray.shape[0],
+                'channels': 3
             }
             
-            # Convert to grayscale
-            self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-            self.results['processing_steps'].append("Image loaded and converted to grayscale")
+            self.results['processing_steps'].append("Image loaded as grayscale")
             
-            print(f"✓ Image loaded successfully: {self.image.shape[1]}x{self.image.shape[0]}")
+            print(f"✓ Image loaded successfully: {self.gray.shape[1]}x{self.gray.shape[0]}")
             return True
             
         except Exception as e:
             print(f"✗ Error loading image: {e}")
             return False
     
+    def _ensure_color(self):
+        """Load the color image if only the grayscale one has been read"""
+        if self.image is None and self.image_path is not None:
+            self.image = cv2.imread(self.image_path, cv2.IMREAD_COLOR)
+        return self.image
+    
     def preprocess_image(self):
         """Apply preprocessing steps to enhance the image"""
         try:
-            # Apply Gaussian blur to reduce noise
-            self.gray = cv2.GaussianBlur(self.gray, (5, 5), 0)
+            # Apply Gaussian blur to reduce noise, in place on the grayscale buffer
+            self.gray = np.ascontiguousarray(self.gray, dtype=np.uint8)
+            cv2.GaussianBlur(self.gray, (5, 5), 0, dst=self.gray)
             self.results['processing_steps'].append("Applied Gaussian blur (5x5)")
             
-            # Apply adaptive thresholding for better edge detection
-            _, thresh = cv2.threshold(self.gray, 127, 255, cv2.THRESH_BINARY_INV)
-            self.results['processing_steps'].append("Applied binary thresholding")
-            
             print("✓ Image preprocessing completed")
-            return thresh
+            return True
             
         except Exception as e:
             print(f"✗ Error in preprocessing: {e}")
-            return None
+            return False
     
     def detect_edges(self):
         """Detect edges using Canny edge detection"""
@@ -108,69 +245,33 @@ class DiagramAnalyzer:
             print(f"✗ Error finding contours: {e}")
             return []
     
+    def measure_contour(self, contour):
+        """Run the OpenCV measurements for one contour; None if it is too small"""
+        # Calculate basic properties
+        area = cv2.contourArea(contour)
+        if area < 100:  # Filter out very small shapes
+            return None
+        
+        perimeter = cv2.arcLength(contour, True)
+        
+        # Approximate contour to polygon
+        epsilon = 0.02 * perimeter
+        approx = cv2.approxPolyDP(contour, epsilon, True)
+        
+        # Get bounding rectangle
+        x, y, w, h = cv2.boundingRect(contour)
+        return area, perimeter, len(approx), x, y, w, h
+    
     def analyze_shape(self, contour):
         """Analyze a single contour to determine shape properties"""
         try:
-            # Calculate basic properties
-            area = cv2.contourArea(contour)
-            perimeter = cv2.arcLength(contour, True)
-            
-            if area < 100:  # Filter out very small shapes
+            measured = self.measure_contour(contour)
+            if measured is None:
                 return None
-            
-            # Approximate contour to polygon
-            epsilon = 0.02 * perimeter
-            approx = cv2.approxPolyDP(contour, epsilon, True)
-            vertices = len(approx)
-            
-            # Get bounding rectangle
-            x, y, w, h = cv2.boundingRect(contour)
-            aspect_ratio = w / h
-            
-            # Calculate circularity
-            circularity = 4 * np.pi * area / (perimeter * perimeter) if perimeter > 0 else 0
-            
-            # Determine shape type
-            shape_type = "Unknown"
-            confidence = 0.5
-            
-            if vertices == 3:
-                shape_type = "Triangle"
-                confidence = 0.9
-            elif vertices == 4:
-                if 0.95 <= aspect_ratio <= 1.05:
-                    shape_type = "Square"
-                    confidence = 0.9
-                else:
-                    shape_type = "Rectangle"
-                    confidence = 0.85
-            elif vertices > 4:
-                if circularity > 0.7:
-                    shape_type = "Circle"
-                    confidence = 0.8
-                else:
-                    shape_type = f"Polygon ({vertices} sides)"
-                    confidence = 0.7
-            
-            return {
-                'type': shape_type,
-                'confidence': confidence,
-                'area': float(area),
-                'perimeter': float(perimeter),
-                'vertices': int(vertices),
-                'aspect_ratio': float(aspect_ratio),
-                'circularity': float(circularity),
-                'bounding_box': {
-                    'x': int(x),
-                    'y': int(y),
-                    'width': int(w),
-                    'height': int(h)
-                },
-                'centroid': {
-                    'x': int(x + w/2),
-                    'y': int(y + h/2)
-                }
-            }
+            area, perimeter, vertices, x, y, w, h = measured
+            code, confidence, aspect_ratio, circularity = _classify(area, perimeter, w, h, vertices)
+            return _shape_dict(code, confidence, area, perimeter, vertices,
+                               aspect_ratio, circularity, x, y, w, h)
             
         except Exception as e:
             print(f"✗ Error analyzing shape: {e}")
@@ -180,21 +281,43 @@ class DiagramAnalyzer:
         """Analyze all detected contours"""
         print(f"\n📊 Analyzing {len(contours)} contours...")
         
-        shapes = []
-        total_area = 0
-        shape_counts = {}
-        
+        # One Python pass collects the OpenCV measurements...
+        measurements = []
         for i, contour in enumerate(contours):
-            shape_info = self.analyze_shape(contour)
-            if shape_info:
-                shapes.append(shape_info)
-                total_area += shape_info['area']
-                
-                # Count shape types
-                shape_type = shape_info['type']
-                shape_counts[shape_type] = shape_counts.get(shape_type, 0) + 1
-                
-                print(f"  Shape {i+1}: {shape_type} (Area: {shape_info['area']:.0f}px²)")
+            try:
+                measured = self.measure_contour(contour)
+            except Exception as e:
+                print(f"✗ Error analyzing shape: {e}")
+                continue
+            if measured is not None:
+                measurements.append((*measured, i))
+        
+        # ...which are written into the table a column at a time; type_code,
+        # confidence, aspect_ratio and circularity are filled by classify_shapes
+        table = np.empty(len(measurements), dtype=SHAPE_DTYPE)
+        for name, column in zip(_MEASURED_FIELDS, zip(*measurements)):
+            table[name] = column
+        
+        # ...then classify all of them in one pass over the columns
+        classify_shapes(table['area'], table['perimeter'], table['w'], table['h'], table['vertices'],
+                        table['type_code'], table['confidence'], table['aspect_ratio'], table['circularity'])
+        
+        # Aggregates come straight from the columns
+        total_area = float(table['area'].sum())
+        shape_counts = _shape_counts(table)
+        
+        # Dicts are only built for the JSON results. The measurements are still
+        # Python scalars, so only the classified columns are read back
+        shapes = []
+        self.contour_shapes = [None] * len(contours)
+        classified = zip(table['type_code'].tolist(), table['confidence'].tolist(),
+                         table['aspect_ratio'].tolist(), table['circularity'].tolist())
+        for (area, perimeter, vertices, x, y, w, h, i), (code, confidence, aspect_ratio, circularity) in zip(measurements, classified):
+            shape_info = _shape_dict(code, confidence, area, perimeter, vertices,
+                                     aspect_ratio, circularity, x, y, w, h)
+            shapes.append(shape_info)
+            self.contour_shapes[i] = shape_info
+            print(f"  Shape {i+1}: {shape_info['type']} (Area: {shape_info['area']:.0f}px²)")
         
         # Calculate statistics
         self.results['shapes'] = shapes
@@ -212,11 +335,15 @@ class DiagramAnalyzer:
         
         return shapes
     
-    def create_visualization(self, contours, output_path):
-        """Create a visualization of the detected shapes"""
+    def create_visualization_array(self, contours, shape_infos=None):
+        """Draw the detected shapes onto a copy of the image and return it.
+        
+        shape_infos is one analyze_shape result per contour (None to skip),
+        e.g. self.contour_shapes; without it each contour is analyzed here.
+        """
         try:
             # Create a copy of the original image
-            vis_image = self.image.copy()
+            vis_image = self._ensure_color().copy()
             
             # Draw contours with different colors
             colors = [
@@ -228,24 +355,39 @@ class DiagramAnalyzer:
                 (0, 255, 255),  # Yellow
             ]
             
-            for i, contour in enumerate(contours):
-                if cv2.contourArea(contour) > 100:  # Only draw significant contours
-                    color = colors[i % len(colors)]
-                    cv2.drawContours(vis_image, [contour], -1, color, 2)
-                    
-                    # Add shape label
-                    shape_info = self.analyze_shape(contour)
-                    if shape_info:
-                        x, y = shape_info['centroid']['x'], shape_info['centroid']['y']
-                        cv2.putText(vis_image, shape_info['type'], (x-30, y), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            if shape_infos is None:
+                shape_infos = [self.analyze_shape(contour) for contour in contours]
+            
+            for i, (contour, shape_info) in enumerate(zip(contours, shape_infos)):
+                # Only draw significant contours
+                if shape_info is None:
+                    continue
+                color = colors[i % len(colors)]
+                cv2.drawContours(vis_image, [contour], -1, color, 2)
+                
+                # Add shape label
+                x, y = shape_info['centroid']['x'], shape_info['centroid']['y']
+                cv2.putText(vis_image, shape_info['type'], (x-30, y), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            
+            return vis_image
             
+        except Exception as e:
+            print(f"✗ Error creating visualization: {e}")
+            return None
+    
+    def create_visualization(self, contours, output_path, shape_infos=None):
+        """Create a visualization of the detected shapes"""
+        vis_image = self.create_visualization_array(contours, shape_infos)
+        if vis_image is None:
+            return
+        try:
             # Save visualization
             cv2.imwrite(output_path, vis_image)
             print(f"✓ Visualization saved to: {output_path}")
             
         except Exception as e:
-            print(f"✗ Error creating visualization: {e}")
+            print(f"✗ Error saving visualization: {e}")
     
     def save_results(self, output_path):
         """Save analysis results to JSON file"""
@@ -267,8 +409,7 @@ class DiagramAnalyzer:
             return False
         
         # Preprocess image
-        thresh = self.preprocess_image()
-        if thresh is None:
+        if not self.preprocess_image():
             return False
         
         # Detect edges
@@ -292,7 +433,7 @@ class DiagramAnalyzer:
         
         if save_visualization:
             vis_path = output_dir / f"{base_name}_analysis.png"
-            self.create_visualization(contours, str(vis_path))
+            self.create_visualization(contours, str(vis_path), self.contour_shapes)
         
         if save_json:
             json_path = output_dir / f"{base_name}_results.json"
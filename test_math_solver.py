@@ -0,0 +1,56 @@
+import unittest
+
+from math_solver import try_sympy_solve, validate_expression
+
+
+class PowerLimitTest(unittest.TestCase):
+    """Power towers must be rejected by the validator, not left to SymPy."""
+
+    def assert_rejected(self, question, reason):
+        result, steps, error = try_sympy_solve(question)
+        self.assertIsNone(result)
+        self.assertEqual(error, f"Invalid expression: {reason}")
+
+    def test_symbolic_towers_are_rejected(self):
+        self.assert_rejected('9**9**9**9 + x', "Nested powers are not supported")
+        self.assert_rejected('x = 9**9**9**9 * y', "Nested powers are not supported")
+        self.assert_rejected('x**2**2 = 16', "Nested powers are not supported")
+
+    def test_power_inside_exponent_is_rejected(self):
+        self.assert_rejected('2**(3**4) + x', "Nested powers are not supported")
+        self.assert_rejected('(9**9)**(9**9)', "Nested powers are not supported")
+
+    def test_large_numeric_exponent_is_rejected(self):
+        self.assert_rejected('x = 9**99999999', "Exponent too large")
+        self.assert_rejected('2**1e5 + x', "Exponent too large")
+        self.assert_rejected('2**sqrt(1e20) + x', "Exponent too large")
+
+    def test_large_exact_values_still_solve(self):
+        result, steps, error = try_sympy_solve('x = 2**2000')
+        self.assertIsNone(error)
+        self.assertEqual(result, [2 ** 2000])
+
+        result, steps, error = try_sympy_solve('10**400/10**399')
+        self.assertIsNone(error)
+        self.assertEqual(float(result), 10.0)
+
+    def test_ordinary_powers_are_valid(self):
+        for expr in ('x**2 = 4', '(2**3)**2', '2**-3 + x', '2**(x+1) = 8'):
+            self.assertEqual(validate_expression(expr), (True, 'Valid expression'), expr)
+
+
+class FunctionWhitelistTest(unittest.TestCase):
+    """Only the math functions the solver supports may reach parse_expr."""
+
+    def test_sympy_utilities_are_rejected(self):
+        for expr in ('plot(x+1)', 'preview(x+1)', 'var(x+1)', 'init_printing(1)', 'Symbol(1)'):
+            name = expr.split('(')[0]
+            self.assertEqual(validate_expression(expr), (False, f"Unknown function '{name}'"), expr)
+
+    def test_math_functions_are_valid(self):
+        for expr in ('sin(30)+1', 'sqrt(16)', 'ln(5)', 'abs(-3)', 'factorial(5)', '2*atan(1)'):
+            self.assertEqual(validate_expression(expr), (True, 'Valid expression'), expr)
+
+
+if __name__ == '__main__':
+    unittest.main()